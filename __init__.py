@@ -1,4 +1,3 @@
-import ctypes
 import os
 import sys
 import tempfile
@@ -40,30 +39,9 @@ def list_split(l, indices_or_sections):
     return sub_arys
 
 
-def killthread(threadobject):
-    # based on https://pypi.org/project/kthread/
-    if not threadobject.is_alive():
-        return True
-    tid = -1
-    for tid1, tobj in threading._active.items():
-        if tobj is threadobject:
-            tid = tid1
-            break
-    if tid == -1:
-        sys.stderr.write(f"{threadobject} not found")
-        return False
-    res = ctypes.pythonapi.PyThreadState_SetAsyncExc(
-        ctypes.c_long(tid), ctypes.py_object(SystemExit)
-    )
-    if res == 0:
-        return False
-    elif res != 1:
-        ctypes.pythonapi.PyThreadState_SetAsyncExc(tid, 0)
-        return False
-    return True
-
-
 class GeteventPlayBack:
+    _STRUCT = struct.Struct("llHHI")
+
     def __init__(
         self,
         adb_path,
@@ -99,7 +77,7 @@ class GeteventPlayBack:
             - _format_binary_data(): Format binary data from 'getevent' output into events.
 
         Attributes:
-            - alldata (list): The raw 'getevent' output data.
+            - alldata (bytearray): The raw 'getevent' output data.
             - FORMAT (str): The format string for parsing binary data.
             - chunk_size (int): The size of each event in bytes.
             - timestampnow (float): The current timestamp.
@@ -107,11 +85,11 @@ class GeteventPlayBack:
         self.adb_path = adb_path
         self.device = device
         self.device_serial = device_serial
-        self.alldata = []
+        self.alldata = bytearray()
         self.print_output = print_output
         self.pr = None
-        self.FORMAT = "llHHI"
-        self.chunk_size = struct.calcsize(self.FORMAT)
+        self.FORMAT = self._STRUCT.format
+        self.chunk_size = self._STRUCT.size
         self.timestampnow = time.time()
         self.clusterevents = clusterevents
         self.tmpfolder_device = tmpfolder_device
@@ -123,14 +101,15 @@ class GeteventPlayBack:
         self,
         pr,
     ):
+        fd = pr.stdout.fileno()
         try:
-            for l in iter(pr.stdout.readline, b""):
+            while chunk := os.read(fd, 65536):
                 if self.print_output:
-                    print(l)
-                self.alldata.append(l)
+                    print(chunk)
+                self.alldata.extend(chunk)
         except Exception:
             try:
-                self.pr.stdout.close()
+                pr.stdout.close()
             except Exception as fe:
                 sys.stderr.write(f"{fe}")
                 sys.stderr.flush()
@@ -152,23 +131,37 @@ class GeteventPlayBack:
                 - 'clusteredevents': Events grouped into clusters.
                 - 'filesnames_pc': List of paths to binary data files on the local HDD.
                 - 'adbcommand': A command to replay events on the device.
-                - 'payload': All byte data captured during the recording.
+                - 'payload': All byte data captured during the recording, as bytes.
         """
         try:
             pr = subprocess.Popen(
-                f"{self.adb_path} -s {self.device_serial} shell su -- cat {self.device}",
+                [
+                    self.adb_path,
+                    "-s",
+                    self.device_serial,
+                    "exec-out",
+                    "su",
+                    "--",
+                    "cat",
+                    self.device,
+                ],
                 stdout=subprocess.PIPE,
                 stderr=subprocess.DEVNULL,
                 stdin=subprocess.DEVNULL,
                 bufsize=0,
             )
-            t3 = threading.Thread(target=self._read_stdout, kwargs={"pr": pr})
+            t3 = threading.Thread(
+                target=self._read_stdout, kwargs={"pr": pr}, daemon=True
+            )
             t3.start()
             input("Press ENTER to stop")
+            # killing adb ends the pipe, which is what stops the reader's os.read loop
             killall(
                 pr,
                 t3,
             )
+            if not t3.is_alive():
+                pr.stdout.close()
         except Exception as fe:
             sys.stderr.write(f"{fe}")
             sys.stderr.flush()
@@ -177,70 +170,64 @@ class GeteventPlayBack:
         return finalresults
 
     def _get_files_and_cmd(self, unpacked_data):
-        close2timestamp = []
         self.timestampnow = time.time()
-        parseddata = [
-            x
-            for ini, x in enumerate(unpacked_data)
-            if (
-                x[0][0] > self.timestampnow * 0.95
-                and close2timestamp.append(ini) is None
-            )
-            or x
+        threshold = self.timestampnow * 0.95
+        parseddata = list(unpacked_data)
+        close2timestamp = [
+            ini for ini, x in enumerate(parseddata) if x[0][0] > threshold
+        ]
+        div_points = [0] + close2timestamp + [len(parseddata)]
+        singleevents = [
+            parseddata[st:end]
+            for st, end in zip(div_points, div_points[1:])
+            if st < end
+        ]
+        clusteredevents = [
+            singleevents[i : i + self.clusterevents]
+            for i in range(0, len(singleevents), self.clusterevents)
         ]
-        singleevents = list_split(l=parseddata, indices_or_sections=close2timestamp)
-        singleevents = [x for x in singleevents if x]
-        clusteredevents = list_split(
-            singleevents, len(singleevents) // self.clusterevents
-        )
-        clusteredevents = [x for x in clusteredevents if x]
 
         subprocess.run(
-            f"{self.adb_path} -s {self.device_serial} shell",
+            [self.adb_path, "-s", self.device_serial, "shell"],
             input=b"mkdir -p " + self.tmpfolder_device.encode() + b"\n",
             bufsize=0,
         )
 
         filesnamepc = []
         adbcommands = []
-        allbytedata = []
+        allbytedata = bytearray()
         for ini, groupevents in enumerate(clusteredevents):
-            binarydata = []
             tmpfilenamehdd = os.path.join(self.tempfolder_hdd, str(ini) + ".bin")
             filesnamepc.append(tmpfilenamehdd)
-            for each_event in groupevents:
-                if not each_event:
-                    continue
-                for evi in each_event:
-                    try:
-                        binarydata.append(evi[5])
-                    except Exception as fe:
-                        binarydata.append(evi[0][5])
+            binarydata = [evi[0][5] for each_event in groupevents for evi in each_event]
             joinedbin = b"".join(binarydata)
-            allbytedata.extend(joinedbin)
+            allbytedata += joinedbin
             with open(tmpfilenamehdd, mode="wb") as f:
                 f.write(joinedbin)
-            subprocess.run(
-                [
-                    self.adb_path,
-                    "-s",
-                    self.device_serial,
-                    "push",
-                    tmpfilenamehdd,
-                    self.tmpfolder_device,
-                ],
-                bufsize=0,
-            )
             adbcommands.append(
-                f"dd bs={(len(joinedbin))} if={self.tmpfolder_device}{ini}.bin of={self.device}"
+                f"dd bs={(len(joinedbin))} if={self.tmpfolder_device}{ini}.bin of={self.device}".encode()
             )
+        # Windows caps a command line at 32767 chars, so push in batches
+        pushcmd = [self.adb_path, "-s", self.device_serial, "push"]
+        basecmdlen = sum(len(x) + 3 for x in pushcmd) + len(self.tmpfolder_device) + 3
+        batch = []
+        batchlen = basecmdlen
+        for tmpfilenamehdd in filesnamepc:
+            if batch and batchlen + len(tmpfilenamehdd) + 3 > 30000:
+                subprocess.run([*pushcmd, *batch, self.tmpfolder_device], bufsize=0)
+                batch = []
+                batchlen = basecmdlen
+            batch.append(tmpfilenamehdd)
+            batchlen += len(tmpfilenamehdd) + 3
+        if batch:
+            subprocess.run([*pushcmd, *batch, self.tmpfolder_device], bufsize=0)
 
         if self.add_closing_command:
             adbcommands.extend(
                 [
-                    f"sendevent {self.device} 0 0 0",
-                    f"sendevent {self.device} 0 2 0",
-                    f"sendevent {self.device} 0 0 0",
+                    f"sendevent {self.device} 0 0 0".encode(),
+                    f"sendevent {self.device} 0 2 0".encode(),
+                    f"sendevent {self.device} 0 0 0".encode(),
                 ]
             )
 
@@ -249,21 +236,19 @@ class GeteventPlayBack:
             "singleevents": singleevents,
             "clusteredevents": clusteredevents,
             "filesnames_pc": filesnamepc,
-            "adbcommand": (b"su -- " + ("\n".join(adbcommands)).encode()),
-            "payload": allbytedata,
+            "adbcommand": b"su -- " + b"\n".join(adbcommands),
+            "payload": bytes(allbytedata),
         }
 
     def _format_binary_data(self):
-        sample_data = b"".join(self.alldata).replace(b"\r\n", b"\n")
-        sample_data = sample_data[
-            : (divmod(len(sample_data), self.chunk_size)[0] * self.chunk_size)
-        ]
-        allbytedata = []
+        sample_data = bytes(self.alldata)
+        datalen = divmod(len(sample_data), self.chunk_size)[0] * self.chunk_size
         unpacked_data = [
-            [struct.unpack(self.FORMAT, g) + (g,)]
-            if not allbytedata.append((g := sample_data[i : i + self.chunk_size]))
-            else None
-            for i in range(0, len(sample_data), self.chunk_size)
+            [record + (sample_data[i : i + self.chunk_size],)]
+            for i, record in zip(
+                range(0, datalen, self.chunk_size),
+                self._STRUCT.iter_unpack(memoryview(sample_data)[:datalen]),
+            )
         ]
         return unpacked_data
 
@@ -274,7 +259,7 @@ def killall(*args):
             arg.kill()
         except Exception:
             try:
-                killthread(arg)
+                arg.join(timeout=1)
             except Exception:
                 pass
 